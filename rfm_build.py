@@ -9,16 +9,36 @@
 
 from __future__ import annotations
 import argparse
+import codecs
+import csv
+import re
 from pathlib import Path
 import sys
 import math
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from scipy.stats import rankdata
 from datetime import datetime, timedelta
 
+# Optional fast aggregation backend (pandas groupby otherwise)
+try:
+    import polars as pl
+except Exception:
+    pl = None
+
+# Optional JIT for the segment labeling kernel (np.select otherwise)
+try:
+    import numba
+except Exception:
+    numba = None
+
 # Optional plotting (only if --plots)
 try:
     import matplotlib.pyplot as plt  # no seaborn by requirement
+    from matplotlib.lines import Line2D
 except Exception:
     plt = None
 
@@ -38,57 +58,151 @@ def parse_args():
     return p.parse_args()
 
 # ------------------------ IO helpers ------------------------ #
-def try_read_csv(path: Path, sep=None, encoding=None) -> pd.DataFrame:
-    seps = [sep] if sep else [",", ";", "\t", "|"]
-    encs = [encoding] if encoding else ["utf-8", "utf-8-sig", "cp1253", "cp1252"]
+SEPS = [",", ";", "\t", "|"]
+ENCODINGS = ["utf-8", "utf-8-sig", "cp1253", "cp1252"]
+REQUIRED_COLS = ["customer_id", "order_date", "amount_eur"]
+# Transactions are streamed in blocks; only per-order partials stay in memory
+CHUNK_BYTES = 16 << 20
+CHUNK_ROWS = 500_000
+RESTART = None  # iter_csv_chunks marker: drop chunks received so far
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+def sniff_encoding(head: bytes) -> str:
+    # BOM first, then strict UTF-8; legacy files fall back to Greek codepage
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1253"
+
+def sniff_sep(head: bytes, encoding: str) -> str:
+    header = head.decode(encoding, errors="ignore").splitlines()[0] if head else ""
+    return max(SEPS, key=header.count)
+
+def has_required(df: pd.DataFrame) -> bool:
+    return all(c in df.columns for c in REQUIRED_COLS)
+
+def iter_csv_chunks(path: Path, sep=None, encoding=None):
+    # Yields the file as DataFrames of ~CHUNK_BYTES each, every column as text
+    # (coerce_columns does the typing). Fast path: Arrow's streaming reader.
+    # A bad block can only surface after earlier chunks went out; the read then
+    # restarts on the next candidate and yields RESTART first, telling the
+    # caller to discard everything it got so far.
+    with open(path, "rb") as fh:
+        head = fh.read(64 * 1024)
+    enc = encoding or sniff_encoding(head)
+    s = sep or sniff_sep(head, enc)
+    reader = None
+    try:
+        header = head.decode(enc, errors="ignore").splitlines()[0]
+        names = next(csv.reader([header], delimiter=s))
+        reader = pacsv.open_csv(
+            path,
+            read_options=pacsv.ReadOptions(encoding=enc, block_size=CHUNK_BYTES),
+            parse_options=pacsv.ParseOptions(delimiter=s),
+            convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names}),
+        )
+        if not all(c in reader.schema.names for c in REQUIRED_COLS):
+            reader = None
+    except (pa.ArrowInvalid, UnicodeDecodeError, IndexError):
+        reader = None
+    if reader is not None:
+        try:
+            while True:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    return
+                yield batch.to_pandas(split_blocks=True, self_destruct=True)
+        except (pa.ArrowInvalid, UnicodeDecodeError):
+            yield RESTART
+
+    # Fallback: brute-force (sep, encoding) combinations with pandas
+    seps = [sep] if sep else SEPS
+    encs = [encoding] if encoding else ENCODINGS
     errors = []
     for s in seps:
         for e in encs:
             try:
-                df = pd.read_csv(path, sep=s, encoding=e, engine="python")
-                # Basic validation
-                if "customer_id" in df.columns and "order_date" in df.columns and "amount_eur" in df.columns:
-                    return df
+                chunks = pd.read_csv(path, sep=s, encoding=e, engine="python", dtype=str, chunksize=CHUNK_ROWS)
+                first = next(chunks)
+            except Exception as ex:
+                errors.append((s, e, str(ex)))
+                continue
+            # Basic validation
+            if not has_required(first):
+                continue
+            yield first
+            try:
+                for chunk in chunks:
+                    yield chunk
+                return
             except Exception as ex:
                 errors.append((s, e, str(ex)))
+                yield RESTART
     raise RuntimeError(f"Could not read {path}. Tried: {errors[:3]}...")
 
+def trim_whitespace(s: pd.Series) -> pd.Series:
+    # Arrow kernel over the UTF-8 buffer; missing values stay missing
+    arr = pc.utf8_trim_whitespace(pa.array(s, type=pa.string(), from_pandas=True))
+    return pd.Series(arr.to_numpy(zero_copy_only=False), index=s.index, name=s.name)
+
+def parse_amount(s: pd.Series) -> pd.Series:
+    # "1 234,50 €" -> 1234.5; anything that still isn't a number becomes NaN
+    arr = pa.array(s.astype(str), type=pa.string())
+    arr = pc.replace_substring_regex(arr, pattern=r"[€\s]", replacement="")
+    arr = pc.replace_substring(arr, pattern=",", replacement=".")
+    ok = pc.match_substring_regex(arr, pattern=r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+    arr = pc.if_else(ok, arr, pa.scalar(None, pa.string()))
+    values = pc.cast(arr, pa.float64()).to_numpy(zero_copy_only=False)
+    return pd.Series(values, index=s.index, name=s.name)
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    # Explicit ISO format skips pandas' per-value format inference; other
+    # layouts still go through inference. Stored as datetime64[ms], the
+    # coarsest unit polars accepts.
+    sample = s.dropna()
+    fmt = "ISO8601" if len(sample) and ISO_DATE.match(str(sample.iat[0])) else None
+    dates = pd.to_datetime(s, format=fmt, errors="coerce", utc=False, cache=True)
+    if dates.dt.tz is not None:
+        # Offsets like +02:00 come back tz-aware; compare everything in naive UTC
+        dates = dates.dt.tz_convert(None)
+    return dates.astype("datetime64[ms]")
+
 def coerce_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # Builds a new frame of just the typed columns the aggregation needs
+    # instead of copying the whole input; df itself is left untouched
     # Standardize column names to lowercase
-    df.columns = [c.strip().lower() for c in df.columns]
-    # Trim string columns
-    for c in df.select_dtypes(include="object").columns:
-        df[c] = df[c].astype(str).str.strip()
+    cols = {c.strip().lower(): c for c in df.columns}
     # Required columns
     required = ["customer_id", "order_id", "order_date", "amount_eur"]
-    missing = [c for c in required if c not in df.columns]
+    missing = [c for c in required if c not in cols]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
 
+    # Trim the id columns
+    customer = trim_whitespace(df[cols["customer_id"]]).to_numpy()
+    order = trim_whitespace(df[cols["order_id"]]).to_numpy()
     # Parse dates
-    df["order_date"] = pd.to_datetime(df["order_date"], errors="coerce", utc=False)
+    order_date = parse_dates(trim_whitespace(df[cols["order_date"]])).to_numpy()
     # Amount: make numeric; replace commas, currency symbols if any
-    df["amount_eur"] = (
-        df["amount_eur"]
-        .astype(str)
-        .str.replace(",", ".", regex=False)
-        .str.replace("€", "", regex=False)
-        .str.replace(" ", "", regex=False)
-    )
-    df["amount_eur"] = pd.to_numeric(df["amount_eur"], errors="coerce")
-
-    # Drop invalid rows
-    before = len(df)
-    df = df[~df["customer_id"].isna() & ~df["order_id"].isna()]
-    df = df[~df["order_date"].isna() & ~df["amount_eur"].isna()]
-    # Remove negative or absurd amounts (keep zeros? we will drop zeros)
-    df = df[df["amount_eur"] > 0]
-    after = len(df)
-    if after < before:
-        print(f"[clean] dropped {before - after} invalid rows")
+    amount = parse_amount(df[cols["amount_eur"]]).to_numpy()
 
-    return df
+    # Drop invalid rows (missing ids/dates/amounts; negative or zero amounts)
+    # with a single mask
+    valid = pd.notna(customer) & pd.notna(order) & (customer != "") & (order != "")
+    valid &= pd.notna(order_date) & (amount > 0)
+
+    # Integer codes for the id columns: cheaper to hash than strings
+    out = {
+        "customer_id": pd.Categorical(customer[valid]),
+        "order_id": pd.Categorical(order[valid]),
+        "order_date": order_date[valid],
+        "amount_eur": amount[valid],
+    }
+    return pd.DataFrame(out, copy=False)
 
 def pick_snapshot(df: pd.DataFrame, user_snapshot: str | None) -> pd.Timestamp:
     if user_snapshot:
@@ -104,71 +218,187 @@ def pick_snapshot(df: pd.DataFrame, user_snapshot: str | None) -> pd.Timestamp:
     return (max_date + pd.Timedelta(days=1)).normalize()
 
 # ------------------------ Feature engineering ------------------------ #
-def rfm_features(df: pd.DataFrame, snapshot: pd.Timestamp) -> pd.DataFrame:
-    # Base aggregations
-    grp = df.groupby("customer_id", as_index=False).agg(
-        Monetary=("amount_eur", "sum"),
-        Frequency=("order_id", "nunique"),
-        FirstPurchase=("order_date", "min"),
-        LastPurchase=("order_date", "max"),
-        AvgOrderValue=("amount_eur", "mean")
+ORDER_KEYS = ["customer_id", "order_id", "order_date"]
+
+def aggregate_orders(df: pd.DataFrame) -> pd.DataFrame:
+    # Collapse transaction lines to one row per (customer, order, date);
+    # associative, so chunk partials can be re-aggregated the same way
+    return df.groupby(ORDER_KEYS, observed=True, as_index=False).agg(
+        amount_eur=("amount_eur", "sum"),
+        lines=("amount_eur", "size")
+    )
+
+def combine_orders(partials: list[pd.DataFrame]) -> pd.DataFrame:
+    orders = pd.concat(partials, ignore_index=True)
+    if len(partials) > 1:
+        # The same order may straddle a chunk boundary
+        orders = orders.groupby(ORDER_KEYS, observed=True, as_index=False).agg(
+            amount_eur=("amount_eur", "sum"),
+            lines=("lines", "sum")
+        )
+    orders["customer_id"] = orders["customer_id"].astype("category")
+    orders["order_id"] = orders["order_id"].astype("category")
+    return orders
+
+def aggregate_customers_polars(orders: pd.DataFrame, win_start: pd.Timestamp) -> pd.DataFrame:
+    # Multithreaded hash aggregation over the id codes, sorted like pandas groupby
+    recent = pl.col("order_date") >= win_start.to_pydatetime()
+    lf = pl.DataFrame({
+        "customer": orders["customer_id"].cat.codes.to_numpy(),
+        "order": orders["order_id"].cat.codes.to_numpy(),
+        "order_date": orders["order_date"].to_numpy(),
+        "amount_eur": orders["amount_eur"].to_numpy(),
+        "lines": orders["lines"].to_numpy(),
+    }).lazy()
+    out = (
+        lf.group_by("customer")
+        .agg([
+            pl.col("amount_eur").sum().alias("Monetary"),
+            pl.col("order").n_unique().alias("Frequency"),
+            pl.col("order_date").min().alias("FirstPurchase"),
+            pl.col("order_date").max().alias("LastPurchase"),
+            pl.col("lines").sum().alias("Lines"),
+            pl.col("order").filter(recent).n_unique().alias("OrdersLast90d"),
+            pl.col("amount_eur").filter(recent).sum().alias("MonetaryLast90d"),
+        ])
+        .sort("customer")
+        .collect()
     )
+    return out.to_pandas()
+
+def aggregate_customers(orders: pd.DataFrame, win_start: pd.Timestamp) -> pd.DataFrame:
+    # Expects combine_orders output (categorical ids, one row per order/date);
+    # groups on the integer codes and maps customer_id back at the end
+    if pl is not None:
+        grp = aggregate_customers_polars(orders, win_start)
+    else:
+        # 90-day window metrics ride along as masked columns, so a single
+        # groupby pass covers everything (no second groupby, no merge)
+        mask = (orders["order_date"] >= win_start).to_numpy()
+        order = orders["order_id"].cat.codes.to_numpy()
+        amount = orders["amount_eur"].to_numpy()
+        work = pd.DataFrame({
+            "customer": orders["customer_id"].cat.codes.to_numpy(),
+            "order": order,
+            "order_date": orders["order_date"].to_numpy(),
+            "amount_eur": amount,
+            "lines": orders["lines"].to_numpy(),
+            "amt90": np.where(mask, amount, 0.0),
+            "ord90": np.where(mask, order, np.nan),  # NaN is skipped by nunique
+        }, copy=False)
+
+        grp = work.groupby("customer", as_index=False).agg(
+            Monetary=("amount_eur", "sum"),
+            Frequency=("order", "nunique"),
+            FirstPurchase=("order_date", "min"),
+            LastPurchase=("order_date", "max"),
+            Lines=("lines", "sum"),
+            OrdersLast90d=("ord90", "nunique"),
+            MonetaryLast90d=("amt90", "sum")
+        )
+    grp.insert(0, "customer_id", orders["customer_id"].cat.categories.take(grp.pop("customer")))
+    # Mean over transaction lines, as if computed on the raw rows
+    grp["AvgOrderValue"] = grp["Monetary"] / grp.pop("Lines")
+    return grp
+
+# Rule order matters: the last entry is the default
+SEGMENTS = [
+    "Champions", "Loyal", "Potential Loyalist", "At Risk / Dormant",
+    "Big Spenders", "New Customers", "Regular",
+]
+# Above this many customers, quintile edges come from a random sample
+QUINTILE_SAMPLE = 50_000
+# Below this many customers the numba compile costs more than it saves
+NUMBA_MIN_ROWS = 1_000_000
+
+if numba is not None:
+    @numba.njit(parallel=True, boundscheck=False, cache=True)
+    def segment_codes_numba(R, F, M, out):
+        # One streaming pass over the scores; same cascade as segment_codes
+        for i in numba.prange(R.size):
+            r, f, m = R[i], F[i], M[i]
+            if r >= 4 and f >= 4 and m >= 4:
+                out[i] = 0
+            elif r >= 4 and f >= 3:
+                out[i] = 1
+            elif r >= 3 and f >= 2 and m >= 3:
+                out[i] = 2
+            elif r <= 2 and f <= 2 and m <= 2:
+                out[i] = 3
+            elif r >= 3 and m >= 4:
+                out[i] = 4
+            elif r >= 4 and f <= 2:
+                out[i] = 5
+            else:
+                out[i] = 6
+
+def segment_codes(R: np.ndarray, F: np.ndarray, M: np.ndarray) -> np.ndarray:
+    # Index into SEGMENTS per customer (simple rule-based, first matching rule wins)
+    if numba is not None and R.size >= NUMBA_MIN_ROWS:
+        out = np.empty(R.size, dtype=np.int8)
+        segment_codes_numba(
+            np.ascontiguousarray(R, dtype=np.int8),
+            np.ascontiguousarray(F, dtype=np.int8),
+            np.ascontiguousarray(M, dtype=np.int8),
+            out,
+        )
+        return out
+    conds = [
+        (R >= 4) & (F >= 4) & (M >= 4),
+        (R >= 4) & (F >= 3),
+        (R >= 3) & (F >= 2) & (M >= 3),
+        (R <= 2) & (F <= 2) & (M <= 2),
+        (R >= 3) & (M >= 4),
+        (R >= 4) & (F <= 2),
+    ]
+    return np.select(conds, range(len(conds)), default=len(conds)).astype(np.int8)
+
+def rfm_features(orders: pd.DataFrame, snapshot: pd.Timestamp) -> pd.DataFrame:
+    win_start = snapshot - pd.Timedelta(days=90)
+    grp = aggregate_customers(orders, win_start)
     grp["RecencyDays"] = (snapshot - grp["LastPurchase"]).dt.days.astype(int)
     grp["DaysSinceFirst"] = (snapshot - grp["FirstPurchase"]).dt.days.astype(int)
 
-    # 90-day window metrics
-    win_start = snapshot - pd.Timedelta(days=90)
-    recent = df[df["order_date"] >= win_start]
-    recent_agg = recent.groupby("customer_id", as_index=False).agg(
-        OrdersLast90d=("order_id", "nunique"),
-        MonetaryLast90d=("amount_eur", "sum")
-    )
-    grp = grp.merge(recent_agg, on="customer_id", how="left")
-    grp[["OrdersLast90d", "MonetaryLast90d"]] = grp[["OrdersLast90d", "MonetaryLast90d"]].fillna(0)
-
-    # Percentiles for R/F/M (winsorize for stability)
-    def winsorize(x, q=0.99):
-        hi = x.quantile(q)
-        return np.clip(x, None, hi)
-
-    grp["Monetary_clip"] = winsorize(grp["Monetary"])
-    grp["Frequency_clip"] = winsorize(grp["Frequency"])
-    grp["Recency_inv"] = 1 / (grp["RecencyDays"] + 1)  # smaller recency -> bigger score
-
-    # Score each 1..5 using quintiles
-    def score_quintile(series, reverse=False):
-        # reverse=False: higher = better (F,M, Recency_inv)
-        # reverse=True: higher raw = worse (RecencyDays), but we use Recency_inv instead
-        q = series.rank(method="average", pct=True)
+    # Percentiles for R/F/M (winsorize for stability), on plain ndarrays
+    def winsorize(v, q=0.99):
+        return np.minimum(v, np.quantile(v, q))
+
+    monetary_clip = winsorize(grp["Monetary"].to_numpy())
+    frequency_clip = winsorize(grp["Frequency"].to_numpy())
+    recency_inv = 1 / (grp["RecencyDays"].to_numpy() + 1)  # smaller recency -> bigger score
+
+    # Score each 1..5 using quintiles of the average rank (higher raw value = better).
+    # Large bases rank against a sorted fixed-seed sample instead of sorting the
+    # full column; ties still share their average rank.
+    def score_quintile(v, sample=QUINTILE_SAMPLE):
+        if v.size > sample:
+            s = np.sort(np.random.default_rng(0).choice(v, sample, replace=False))
+            lo = np.searchsorted(s, v, side="left")
+            hi = np.searchsorted(s, v, side="right")
+            q = (lo + hi + 1) / 2 / sample
+        else:
+            q = rankdata(v, method="average") / v.size
         # quintiles: (0, .2], (.2, .4], (.4, .6], (.6, .8], (.8, 1]
-        return (np.ceil(q * 5)).astype(int).clip(1, 5)
+        return np.ceil(q * 5).clip(1, 5).astype(np.int8)
 
-    R_score = score_quintile(grp["Recency_inv"])
-    F_score = score_quintile(grp["Frequency_clip"])
-    M_score = score_quintile(grp["Monetary_clip"])
+    R = score_quintile(recency_inv)
+    F = score_quintile(frequency_clip)
+    M = score_quintile(monetary_clip)
 
-    grp["R_score"] = R_score
-    grp["F_score"] = F_score
-    grp["M_score"] = M_score
+    grp["R_score"] = R
+    grp["F_score"] = F
+    grp["M_score"] = M
     grp["RFM_sum"] = grp["R_score"] + grp["F_score"] + grp["M_score"]
 
-    # Segment naming (simple rule-based)
-    def segment_row(r, f, m):
-        if r >= 4 and f >= 4 and m >= 4:
-            return "Champions"
-        if r >= 4 and f >= 3:
-            return "Loyal"
-        if r >= 3 and f >= 2 and m >= 3:
-            return "Potential Loyalist"
-        if r <= 2 and f <= 2 and m <= 2:
-            return "At Risk / Dormant"
-        if r >= 3 and m >= 4:
-            return "Big Spenders"
-        if r >= 4 and f <= 2:
-            return "New Customers"
-        return "Regular"
-
-    grp["Segment"] = [segment_row(r, f, m) for r, f, m in zip(R_score, F_score, M_score)]
+    # Segment naming
+    grp["Segment"] = pd.Categorical.from_codes(segment_codes(R, F, M), categories=SEGMENTS)
+
+    # Compact dtypes: scores fit in int8, counts in int32; money stays float64
+    grp = grp.astype({
+        "R_score": "int8", "F_score": "int8", "M_score": "int8", "RFM_sum": "int8",
+        "RecencyDays": "int32", "DaysSinceFirst": "int32", "Frequency": "int32",
+        "OrdersLast90d": "int32",
+    })
 
     # Order columns nicely
     cols = [
@@ -180,22 +410,43 @@ def rfm_features(df: pd.DataFrame, snapshot: pd.Timestamp) -> pd.DataFrame:
     grp = grp[cols].sort_values(["RFM_sum", "Monetary", "Frequency"], ascending=[False, False, False]).reset_index(drop=True)
     return grp
 
+def write_csv(df: pd.DataFrame, path: Path):
+    # Arrow's vectorized CSV writer instead of DataFrame.to_csv
+    tbl = pa.Table.from_pandas(df, preserve_index=False)
+    for name in ("FirstPurchase", "LastPurchase"):
+        # Same text as to_csv: YYYY-MM-DD when every time is midnight,
+        # otherwise full seconds (Arrow's default adds .000 milliseconds)
+        col = tbl[name]
+        if pc.all(pc.equal(pc.floor_temporal(col, unit="day"), col)).as_py() is not False:
+            col = pc.cast(col, pa.date32())
+        else:
+            try:
+                col = pc.cast(col, pa.timestamp("s"))  # safe: only when no sub-second part
+            except pa.ArrowInvalid:
+                pass
+            col = pc.strftime(col, format="%Y-%m-%d %H:%M:%S")
+        tbl = tbl.set_column(tbl.schema.get_field_index(name), name, col)
+    pacsv.write_csv(tbl, path)
+
 # ------------------------ Quick plots ------------------------ #
 def quick_plots(df_out: pd.DataFrame):
     if plt is None:
         print("[plots] matplotlib not available, skipping plots")
         return
     try:
-        # Scatter: Frequency vs Monetary colored by Segment
-        segs = df_out["Segment"].unique().tolist()
-        colors = {s: None for s in segs}  # default colors (matplotlib chooses)
+        # Scatter: Frequency vs Monetary colored by Segment (one collection,
+        # colors from the category codes; legend rebuilt from proxy handles)
+        seg = pd.Categorical(df_out["Segment"])
         plt.figure(figsize=(6,5))
-        for s in segs:
-            d = df_out[df_out["Segment"] == s]
-            plt.scatter(d["Frequency"], d["Monetary"], label=s, alpha=0.7)
+        sc = plt.scatter(df_out["Frequency"], df_out["Monetary"], c=seg.codes, cmap="tab10",
+                         vmin=0, vmax=9, alpha=0.7, rasterized=len(df_out) > 50_000)
+        handles = [
+            Line2D([0], [0], marker="o", ls="", color=sc.cmap(sc.norm(i)), alpha=0.7, label=name)
+            for i, name in enumerate(seg.categories) if (seg.codes == i).any()
+        ]
         plt.xlabel("Frequency"); plt.ylabel("Monetary (€)")
         plt.title("RFM Scatter — Frequency vs Monetary")
-        plt.legend(fontsize=8, loc="best")
+        plt.legend(handles=handles, fontsize=8, loc="best")
         plt.tight_layout(); plt.savefig(SCATTER_PNG); plt.close()
 
         # Histogram of Recency
@@ -215,14 +466,27 @@ def main():
         print(f"Input file not found: {path}", file=sys.stderr)
         sys.exit(1)
 
-    df = try_read_csv(path, sep=args.sep, encoding=args.encoding)
-    df = coerce_columns(df)
+    # Stream the file: clean each chunk and keep only its per-order partials
+    partials, before, after = [], 0, 0
+    for chunk in iter_csv_chunks(path, sep=args.sep, encoding=args.encoding):
+        if chunk is RESTART:
+            partials, before, after = [], 0, 0
+            continue
+        before += len(chunk)
+        chunk = coerce_columns(chunk)
+        after += len(chunk)
+        partials.append(aggregate_orders(chunk))
+    if after < before:
+        print(f"[clean] dropped {before - after} invalid rows")
+    if not partials:
+        raise ValueError(f"No rows in {path}")
+    orders = combine_orders(partials)
 
-    snapshot = pick_snapshot(df, args.snapshot)
+    snapshot = pick_snapshot(orders, args.snapshot)
     print(f"[info] snapshot date = {snapshot.date()} (default = max(order_date)+1)")
 
-    out = rfm_features(df, snapshot)
-    out.to_csv(OUT_FILE, index=False, encoding="utf-8")
+    out = rfm_features(orders, snapshot)
+    write_csv(out, OUT_FILE)
     print(f"[ok] wrote {OUT_FILE} with {len(out)} customers")
 
     if args.plots:
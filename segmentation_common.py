@@ -0,0 +1,43 @@
+# segmentation_common.py — Helpers shared by the segmentation scripts
+#
+# Used by: segmentation_train.py, segmentation_eval.py, segmentation_report.py
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Optional SIMD/multithreaded k-means (sklearn estimator otherwise)
+try:
+    import faiss
+except Exception:
+    faiss = None
+
+# Compact dtypes matching what rfm_build.py writes
+RFM_TYPES = {"RecencyDays": pa.int32(), "Frequency": pa.int32(), "Monetary": pa.float32()}
+
+def read_rfm(path, columns=None):
+    # Parse customers_rfm.csv / customers_segments.csv with Arrow's threaded
+    # reader; `columns` limits parsing to the listed columns
+    convert = pacsv.ConvertOptions(column_types=RFM_TYPES, include_columns=columns)
+    tbl = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=4 << 20),
+        convert_options=convert,
+    )
+    return tbl.to_pandas(split_blocks=True, self_destruct=True)
+
+def fit_kmeans(X, k, seed=0, fallback=None, niter=20, nredo=3):
+    # Returns (labels, inertia). Uses faiss when installed, else fits `fallback`
+    # (an unfitted sklearn KMeans-like estimator) on X.
+    if faiss is None:
+        km = fallback.fit(X)
+        return km.labels_, float(km.inertia_)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    # Train on every row: faiss otherwise subsamples to 256 points per centroid.
+    # min_points_per_centroid=1 only silences its small-sample warning.
+    km = faiss.Kmeans(d=X.shape[1], k=k, niter=niter, nredo=nredo, seed=seed, verbose=False,
+                      max_points_per_centroid=len(X), min_points_per_centroid=1)
+    km.train(X)
+    # Squared L2 to the nearest centroid, summed: same definition as sklearn's inertia_
+    dist, lab = km.index.search(X, 1)
+    return lab.ravel(), float(dist.sum())
@@ -1,21 +1,47 @@
 from pathlib import Path
 import pandas as pd, numpy as np
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score, pairwise_distances
+from segmentation_common import fit_kmeans, read_rfm
 
 BASE = Path(".")
-df = pd.read_csv(BASE/"customers_rfm.csv")
-X = df[["RecencyDays","Frequency","Monetary"]].values
+features = ["RecencyDays","Frequency","Monetary"]
+df = read_rfm(BASE/"customers_rfm.csv", columns=features)
+X = df[features].values
 X = StandardScaler().fit_transform(X)
 
+# Silhouette is O(n^2): exact (with shared distances) only for small n, a
+# 10k-row sample up to 50k, and a centroid-based approximation beyond that
+SIL_PRECOMPUTE = 4_000
+SIL_SAMPLE = 10_000
+SIL_APPROX = 50_000
+# Pairwise distances don't depend on k or seed: compute once for all silhouette calls
+# (float32 keeps the n x n matrix at ~64 MB for 4k rows)
+D = (pairwise_distances(X.astype(np.float32), metric="euclidean", n_jobs=-1)
+     if len(X) <= SIL_PRECOMPUTE else None)
+
+def silhouette(X, lab, seed):
+    if D is not None:
+        return silhouette_score(D, lab, metric="precomputed")
+    if len(X) <= SIL_APPROX:
+        return silhouette_score(X, lab, sample_size=SIL_SAMPLE, random_state=seed, metric="euclidean")
+    # Simplified silhouette: own centroid (a) vs nearest other centroid (b), O(n*k*d)
+    ks, lab = np.unique(lab, return_inverse=True)
+    centers = np.stack([X[lab == i].mean(axis=0) for i in range(len(ks))])
+    dist = np.linalg.norm(X[:, None, :] - centers[None, :, :], axis=2)
+    a = dist[np.arange(len(X)), lab]
+    dist[np.arange(len(X)), lab] = np.inf
+    b = dist.min(axis=1)
+    return float(np.mean((b - a) / np.maximum(np.maximum(a, b), 1e-12)))
+
 rows = []
 for k in range(2, 9):
     sils, dbs, chs = [], [], []
     for seed in [0,1,2,3,4]:
-        km = KMeans(n_clusters=k, random_state=seed, n_init=10).fit(X)
-        lab = km.labels_
-        sils.append(silhouette_score(X, lab))
+        fallback = MiniBatchKMeans(n_clusters=k, random_state=seed, batch_size=4096, n_init=3)
+        lab, _ = fit_kmeans(X, k, seed=seed, fallback=fallback)
+        sils.append(silhouette(X, lab, seed))
         dbs.append(davies_bouldin_score(X, lab))
         chs.append(calinski_harabasz_score(X, lab))
     rows.append({
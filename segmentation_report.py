@@ -7,16 +7,52 @@
 # Output: segmentation_report.pdf
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from segmentation_common import read_rfm
+
+# Optional fast aggregation backend (pandas groupby otherwise)
+try:
+    import polars as pl
+except Exception:
+    pl = None
 
 BASE = Path(".").resolve()
 IN_FILE = BASE / "customers_segments.csv"
 OUT_FILE = BASE / "segmentation_report.pdf"
 
+def cluster_summary(df: pd.DataFrame) -> list:
+    # Table rows: header + one pre-formatted row per cluster (means to 2 dp)
+    if pl is not None:
+        summary = (
+            pl.from_pandas(df[["Cluster", "RecencyDays", "Frequency", "Monetary"]])
+            .group_by("Cluster")
+            .agg([
+                pl.col("RecencyDays").mean(),
+                pl.col("Frequency").mean(),
+                pl.col("Monetary").mean(),
+                pl.len().alias("Count"),
+            ])
+            .sort("Cluster")
+        )
+        header, rows = summary.columns, summary.iter_rows()
+    else:
+        summary = df.groupby("Cluster").agg({
+            "RecencyDays": "mean",
+            "Frequency": "mean",
+            "Monetary": "mean",
+            "customer_id": "count"
+        }).rename(columns={"customer_id": "Count"}).reset_index()
+        header, rows = summary.columns.tolist(), summary.itertuples(index=False)
+    return [header] + [
+        [f"{v:.2f}" if isinstance(v, (float, np.floating)) else v for v in row]
+        for row in rows
+    ]
+
 def build_report(df: pd.DataFrame):
     styles = getSampleStyleSheet()
     story = []
@@ -33,15 +69,7 @@ def build_report(df: pd.DataFrame):
     story.append(Spacer(1, 12))
 
     # Cluster summary table
-    summary = df.groupby("Cluster").agg({
-        "RecencyDays": "mean",
-        "Frequency": "mean",
-        "Monetary": "mean",
-        "customer_id": "count"
-    }).rename(columns={"customer_id": "Count"}).reset_index()
-
-    data = [summary.columns.tolist()] + summary.round(2).values.tolist()
-    table = Table(data, hAlign="LEFT")
+    table = Table(cluster_summary(df), hAlign="LEFT")
     table.setStyle(TableStyle([
         ("BACKGROUND", (0,0), (-1,0), colors.grey),
         ("TEXTCOLOR", (0,0), (-1,0), colors.whitesmoke),
@@ -78,7 +106,7 @@ def main():
     if not IN_FILE.exists():
         raise FileNotFoundError(f"Missing {IN_FILE}, run segmentation_train.py first.")
 
-    df = pd.read_csv(IN_FILE)
+    df = read_rfm(IN_FILE, columns=["customer_id", "Cluster", "RecencyDays", "Frequency", "Monetary"])
     doc = SimpleDocTemplate(str(OUT_FILE), pagesize=A4)
     story = build_report(df)
     doc.build(story)
@@ -5,16 +5,20 @@
 #
 # Input:  customers_rfm.csv
 # Output: customers_segments.csv (+ inertia_plot.png, cluster_scatter.png)
+#         model_cache.joblib (fitted scaler + KMeans, reused on reruns; --force refits)
 
 import argparse
+import hashlib
 from pathlib import Path
-import pandas as pd
 import numpy as np
+import joblib
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
+from segmentation_common import faiss, fit_kmeans, read_rfm
 
 try:
     import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
 except Exception:
     plt = None
 
@@ -23,31 +27,49 @@ IN_FILE = BASE / "customers_rfm.csv"
 OUT_FILE = BASE / "customers_segments.csv"
 INERTIA_PNG = BASE / "inertia_plot.png"
 SCATTER_PNG = BASE / "cluster_scatter.png"
+MODEL_CACHE = BASE / "model_cache.joblib"
 
 def parse_args():
     p = argparse.ArgumentParser(description="Cluster customers using KMeans on RFM features")
     p.add_argument("--clusters", type=int, default=4, help="number of clusters (default=4)")
     p.add_argument("--plots", action="store_true", help="save inertia and scatter plots")
+    p.add_argument("--force", action="store_true", help="refit even if a cached model exists")
     return p.parse_args()
 
+def make_kmeans(k):
+    # Used for the labels and as the elbow fallback, so both share settings
+    algo = "elkan" if k > 1 else "lloyd"  # elkan needs at least 2 clusters
+    return KMeans(n_clusters=k, random_state=42, n_init=10, algorithm=algo)
+
 def main():
     args = parse_args()
     if not IN_FILE.exists():
         raise FileNotFoundError(f"Missing {IN_FILE}, run rfm_build.py first.")
 
-    df = pd.read_csv(IN_FILE)
+    df = read_rfm(IN_FILE)
 
     # Features for clustering
     features = ["RecencyDays", "Frequency", "Monetary"]
-    X = df[features].values
+    X = df[features].to_numpy(dtype=np.float32)
+
+    # Single cache file; the key inside says which input file and k it fits
+    key = hashlib.sha1(f"{IN_FILE.stat().st_mtime}-{len(df)}-{args.clusters}".encode()).hexdigest()[:12]
+    cached = joblib.load(MODEL_CACHE) if MODEL_CACHE.exists() and not args.force else None
 
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    if cached is not None and cached[0] == key:
+        _, scaler, km = cached
+        X_scaled = scaler.transform(X)
+        df["Cluster"] = km.predict(X_scaled)
+        print(f"[cache] reused {MODEL_CACHE.name}")
+    else:
+        # Scale features
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
 
-    # Fit KMeans
-    km = KMeans(n_clusters=args.clusters, random_state=42, n_init=10)
-    df["Cluster"] = km.fit_predict(X_scaled)
+        # Fit KMeans
+        km = make_kmeans(args.clusters)
+        df["Cluster"] = km.fit_predict(X_scaled)
+        joblib.dump((key, scaler, km), MODEL_CACHE, compress=3)
 
     # Save output
     df.to_csv(OUT_FILE, index=False, encoding="utf-8")
@@ -55,25 +77,31 @@ def main():
 
     if args.plots and plt is not None:
         # Inertia plot (Elbow method)
-        inertias = []
+        # Every point comes from the same backend and settings; without faiss
+        # the loop fits exactly make_kmeans, so the labelling fit is reused
         ks = range(1, 8)
+        inertias = {args.clusters: km.inertia_} if faiss is None else {}
         for k in ks:
-            km_tmp = KMeans(n_clusters=k, random_state=42, n_init=10).fit(X_scaled)
-            inertias.append(km_tmp.inertia_)
+            if k in inertias:
+                continue
+            _, inertias[k] = fit_kmeans(X_scaled, k, seed=42, fallback=make_kmeans(k))
         plt.figure(figsize=(6,4))
-        plt.plot(ks, inertias, marker="o")
+        plt.plot(ks, [inertias[k] for k in ks], marker="o")
         plt.xlabel("k"); plt.ylabel("Inertia")
         plt.title("Elbow Method")
         plt.tight_layout(); plt.savefig(INERTIA_PNG); plt.close()
 
         # Scatter: Frequency vs Monetary, colored by cluster
         plt.figure(figsize=(6,5))
-        for c in range(args.clusters):
-            d = df[df["Cluster"] == c]
-            plt.scatter(d["Frequency"], d["Monetary"], label=f"Cluster {c}", alpha=0.7)
+        sc = plt.scatter(df["Frequency"], df["Monetary"], c=df["Cluster"], cmap="tab10",
+                         vmin=0, vmax=9, alpha=0.7, rasterized=len(df) > 50_000)
+        handles = [
+            Line2D([0], [0], marker="o", ls="", color=sc.cmap(sc.norm(c)), alpha=0.7, label=f"Cluster {c}")
+            for c in range(args.clusters)
+        ]
         plt.xlabel("Frequency"); plt.ylabel("Monetary (€)")
         plt.title("Clusters — Frequency vs Monetary")
-        plt.legend()
+        plt.legend(handles=handles)
         plt.tight_layout(); plt.savefig(SCATTER_PNG); plt.close()
 
         print(f"[plots] saved {INERTIA_PNG.name}, {SCATTER_PNG.name}")